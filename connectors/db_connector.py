@@ -4,32 +4,60 @@ Adapted for specific process_data table structure
 """
 import logging
 import mariadb
-import configparser
 import datetime
 import sys
 import time
 import threading
+from collections import deque
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on rows per multi-VALUES INSERT, keeps statements below max_allowed_packet
+MAX_BATCH_ROWS = 500
+
+# Sampled rows and events kept while the database is unreachable
+MAX_PENDING_ROWS = 10000
+
+EVENT_INSERT_QUERY = "INSERT INTO event_log (timestamp, event_type, message, severity) VALUES (?, ?, ?, ?)"
+
 
 class DbConnector:
     """Database connector for storing OPC-UA values in MariaDB"""
 
-    def __init__(self, config_file='config.ini'):
-        """Initialize the database connection"""
-        self.config = configparser.ConfigParser()
-        self.config.read(config_file)
+    def __init__(self, config):
+        """Initialize the database connection from a parsed configuration"""
+        self.config = config
 
-        self.conn = None
-        self.cursor = None
+        self.pool = None
         self.connected = False
-        self.config_file = config_file
 
-        # Current values cache with mapping to db fields
-        self.current_values = {}
         self.opc_to_db_mapping = {}
 
+        # Current values stored as parallel lists indexed by mapped tag
+        self._tag_index = {}
+        self._db_fields = []
+        self._values = []
+        self._units = []
+        self._values_lock = threading.Lock()
+
+        # Multi-row INSERT strings keyed by row count, reused across flushes
+        self._insert_row = ""
+        self._insert_prefix = ""
+        self._prepared = {}
+
+        # Pooled connection and prepared INSERT cursor held by the writer between flushes
+        self._writer_conn = None
+        self._insert_cursor = None
+
+        # Sampled rows waiting to be written as one batch
+        self._pending = deque(maxlen=MAX_PENDING_ROWS)
+        self.batch_size = 1
+
+        # Events waiting to be written after the next batch, in their own transaction
+        self._pending_events = deque(maxlen=MAX_PENDING_ROWS)
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
         # Logging control
         self.logging_active = False
         self.logging_thread = None
@@ -41,17 +69,16 @@ class DbConnector:
     def init_config(self):
         """Ensure database section exists in config"""
         if 'DATABASE' not in self.config:
-            logger.warning("No DATABASE section in config.ini, creating default")
+            logger.warning("No DATABASE section in config, using defaults")
             self.config['DATABASE'] = {
                 'enabled': 'false',
                 'host': 'localhost',
                 'user': 'opcua_user',
                 'password': 'password',
                 'database': 'opcua_gateway',
-                'log_interval': '60'  # seconds
+                'log_interval': '60',  # seconds
+                'batch_size': '1'  # rows per INSERT
             }
-            with open(self.config_file, 'w') as f:
-                self.config.write(f)
 
     def connect(self):
         """Connect to the database"""
@@ -59,14 +86,24 @@ class DbConnector:
             logger.info("Database logging disabled in config")
             return False
 
+        # One connection per HTTP worker thread plus one held by the background writer
+        min_pool_size = self.config.getint('HTTP', 'threads', fallback=8) + 1
+        pool_size = self.config.getint('DATABASE', 'pool_size', fallback=min_pool_size)
+        if pool_size < min_pool_size:
+            logger.warning("Database pool_size %s is smaller than HTTP threads + 1 (%s), "
+                           "history requests may fail under load", pool_size, min_pool_size)
+
         try:
-            self.conn = mariadb.connect(
+            # Separate connections for the background writer and HTTP history queries
+            self.pool = mariadb.ConnectionPool(
+                pool_name="opcua",
+                pool_size=pool_size,
                 host=self.config.get('DATABASE', 'host', fallback='localhost'),
                 user=self.config.get('DATABASE', 'user', fallback='opcua_user'),
                 password=self.config.get('DATABASE', 'password', fallback='password'),
-                database=self.config.get('DATABASE', 'database', fallback='opcua_gateway')
+                database=self.config.get('DATABASE', 'database', fallback='opcua_gateway'),
+                autocommit=False
             )
-            self.cursor = self.conn.cursor()
             self.connected = True
             logger.info("Connected to database successfully")
 
@@ -78,22 +115,39 @@ class DbConnector:
 
             return True
         except mariadb.Error as e:
-            logger.error(f"Error connecting to database: {e}")
+            logger.error("Error connecting to database: %s", e)
             self.connected = False
             return False
 
     def _load_tag_mappings(self):
         """Load OPC tag to database field mappings"""
         try:
-            self.cursor.execute("SELECT opc_tag_name, db_field_name FROM tagnames")
-            mappings = self.cursor.fetchall()
+            with self.pool.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT opc_tag_name, db_field_name FROM tagnames")
+                mappings = cursor.fetchall()
 
             self.opc_to_db_mapping = {tag: field for tag, field in mappings}
-            logger.info(f"Loaded {len(self.opc_to_db_mapping)} tag mappings from database")
+            logger.info("Loaded %s tag mappings from database", len(self.opc_to_db_mapping))
         except mariadb.Error as e:
-            logger.error(f"Error loading tag mappings: {e}")
+            logger.error("Error loading tag mappings: %s", e)
             self.opc_to_db_mapping = {}
 
+        self._build_value_store()
+
+    def _build_value_store(self):
+        """Assign a fixed slot to every mapped tag and precompute the INSERT columns"""
+        tags = list(self.opc_to_db_mapping)
+        with self._values_lock:
+            self._tag_index = {tag: i for i, tag in enumerate(tags)}
+            self._db_fields = [self.opc_to_db_mapping[tag] for tag in tags]
+            self._values = [None] * len(tags)
+            self._units = [""] * len(tags)
+
+        self._insert_row = f"({', '.join(['?'] * (len(tags) + 1))})"
+        self._insert_prefix = f"INSERT INTO process_data (timestamp, {', '.join(self._db_fields)}) VALUES "
+        self._prepared.clear()
+
     def _start_logging_thread(self):
         """Start the background logging thread"""
         if not self.config.getboolean('DATABASE', 'enabled', fallback=False):
@@ -104,70 +158,196 @@ class DbConnector:
             logger.warning("Invalid log interval, setting to 60 seconds")
             log_interval = 60
 
+        self.batch_size = self.config.getint('DATABASE', 'batch_size', fallback=1)
+        if self.batch_size <= 0:
+            logger.warning("Invalid batch size, setting to 1")
+            self.batch_size = 1
+
         self.shutdown_event.clear()
         self.logging_thread = threading.Thread(target=self._logging_worker, args=(log_interval,))
         self.logging_thread.daemon = True
         self.logging_thread.start()
         self.logging_active = True
-        logger.info(f"Database logging thread started with interval of {log_interval} seconds")
+        logger.info("Database logging thread started with interval of %s seconds", log_interval)
 
     def _logging_worker(self, interval):
         """Background worker that logs data at specified intervals"""
         while not self.shutdown_event.is_set():
             try:
-                if self.connected and self.current_values:
-                    self._log_current_values()
+                if self.connected and self._tag_index:
+                    self._sample_current_values()
+                    if len(self._pending) >= self.batch_size or self._pending_events:
+                        self.flush()
             except Exception as e:
-                logger.error(f"Error in logging thread: {e}")
+                logger.error("Error in logging thread: %s", e)
+
+            # Sleep until the next tick, waking immediately on shutdown
+            if self.shutdown_event.wait(interval):
+                break
 
-            # Sleep but check for shutdown periodically
-            for _ in range(interval):
-                if self.shutdown_event.is_set():
-                    break
-                time.sleep(1)
+        # Write out whatever is still buffered before the thread exits
+        if self.connected:
+            self.flush()
 
-    def _log_current_values(self):
-        """Log current values to process_data table"""
-        if not self.connected or not self.current_values:
+    def _sample_current_values(self):
+        """Snapshot current values into the pending batch"""
+        with self._values_lock:
+            values = self._values[:]
+
+        if all(value is None for value in values):  # No actual data
             return
 
+        with self._pending_lock:
+            self._pending.append((datetime.datetime.now(), values))
+
+    def _insert_query(self, row_count):
+        """Return the multi-row INSERT for a batch size, building it on first use"""
+        query = self._prepared.get(row_count)
+        if query is None:
+            query = self._insert_prefix + ", ".join([self._insert_row] * row_count)
+            self._prepared[row_count] = query
+        return query
+
+    def flush(self):
+        """Write pending process data rows and events, returns False if the connection failed"""
+        if not self.connected:
+            return False
+
+        with self._flush_lock:
+            return self._flush_pending()
+
+    def _flush_pending(self):
+        """Write pending rows to process_data table, then queued events in their own transaction"""
+        # Take the items out so appends during the flush cannot shift what gets removed
+        with self._pending_lock:
+            rows = list(self._pending)
+            self._pending.clear()
+            events = list(self._pending_events)
+            self._pending_events.clear()
+        if not rows and not events:
+            return True
+
         try:
-            # Build INSERT query dynamically based on available values
-            field_names = ["timestamp"]
-            placeholders = ["NOW()"]
-            values = []
-
-            # Map OPC tags to database fields and collect values
-            for tag_name, value_dict in self.current_values.items():
-                if tag_name in self.opc_to_db_mapping:
-                    db_field = self.opc_to_db_mapping[tag_name]
-                    field_names.append(db_field)
-                    placeholders.append("?")
-                    values.append(value_dict["value"])
-
-            if len(field_names) <= 1:  # Only timestamp, no actual data
-                return
+            cursor = self._writer_cursor()
+        except mariadb.Error as e:
+            logger.error("Error getting database connection from pool: %s", e)
+            self._requeue(rows, events)
+            return False
 
-            # Construct and execute query
-            query = f"INSERT INTO process_data ({', '.join(field_names)}) VALUES ({', '.join(placeholders)})"
-            self.cursor.execute(query, values)
-            self.conn.commit()
-            logger.debug(f"Logged {len(values)} process values to database")
+        conn = self._writer_conn
+        if rows:
+            unwritten = self._write_items(conn, rows, lambda items: self._insert_rows(cursor, items),
+                                          "process data row")
+            if unwritten:
+                self._requeue(unwritten, events)
+                return False
+        if events:
+            unwritten = self._write_items(conn, events, lambda items: self._insert_events(conn, items), "event")
+            if unwritten:
+                self._requeue([], unwritten)
+                return False
+        return True
+
+    def _requeue(self, rows, events):
+        """Put unwritten items back in front of anything queued since, dropping the oldest past the cap"""
+        with self._pending_lock:
+            for queue, items in ((self._pending, rows), (self._pending_events, events)):
+                if items:
+                    newer = list(queue)
+                    queue.clear()
+                    queue.extend(items)
+                    queue.extend(newer)
+
+    def _insert_rows(self, cursor, rows):
+        """Insert sampled rows with one multi-row INSERT per chunk"""
+        for start in range(0, len(rows), MAX_BATCH_ROWS):
+            chunk = rows[start:start + MAX_BATCH_ROWS]
+            params = []
+            for timestamp, values in chunk:
+                params.append(timestamp)
+                params.extend(values)
+
+            cursor.execute(self._insert_query(len(chunk)), params)
+
+    def _insert_events(self, conn, events):
+        """Insert queued events into the event_log table"""
+        with conn.cursor() as cursor:
+            cursor.executemany(EVENT_INSERT_QUERY, events)
+
+    def _write_items(self, conn, items, write, item_name):
+        """Write items in one transaction, one at a time if the database rejects the batch
+
+        Returns the items still unwritten after a connection error, otherwise an empty
+        list. Items the database rejects individually are dropped, since they would fail
+        again on every retry.
+        """
+        try:
+            write(items)
+            conn.commit()
+            logger.debug("Logged %s %s(s) to database", len(items), item_name)
+            return []
+        except (mariadb.OperationalError, mariadb.InterfaceError) as e:
+            self._connection_failed(conn, e)
+            return items
+        except mariadb.Error as e:
+            logger.warning("Database rejected %s %s(s), retrying one at a time: %s", len(items), item_name, e)
+            self._rollback(conn)
 
+        for i, item in enumerate(items):
+            try:
+                write([item])
+                conn.commit()
+            except (mariadb.OperationalError, mariadb.InterfaceError) as e:
+                self._connection_failed(conn, e)
+                return items[i:]
+            except mariadb.Error as e:
+                logger.error("Dropping %s rejected by database: %s", item_name, e)
+                self._rollback(conn)
+        return []
+
+    def _connection_failed(self, conn, error):
+        """Handle a lost connection: reconnect, the next flush prepares the INSERT again"""
+        logger.error("Error logging to database: %s", error)
+        self._try_reconnect(conn)
+        self._release_writer()
+
+    def _rollback(self, conn):
+        """Roll back a failed transaction before the connection is reused"""
+        try:
+            conn.rollback()
         except mariadb.Error as e:
-            logger.error(f"Error logging to process_data table: {e}")
-            # Try to reconnect
-            self._try_reconnect()
+            logger.warning("Error rolling back database transaction: %s", e)
+
+    def _writer_cursor(self):
+        """Return the writer's prepared INSERT cursor, taking a pooled connection on first use"""
+        # The server re-prepares only when the statement text changes, i.e. a new batch size
+        if self._insert_cursor is None:
+            self._writer_conn = self.pool.get_connection()
+            self._insert_cursor = self._writer_conn.cursor(prepared=True)
+        return self._insert_cursor
+
+    def _release_writer(self):
+        """Close the writer's cursor and return its connection to the pool"""
+        try:
+            if self._insert_cursor:
+                self._insert_cursor.close()
+            if self._writer_conn:
+                self._writer_conn.close()
+        except mariadb.Error as e:
+            logger.warning("Error releasing database writer connection: %s", e)
+        finally:
+            self._insert_cursor = None
+            self._writer_conn = None
 
-    def _try_reconnect(self):
-        """Try to reconnect to database after an error"""
+    def _try_reconnect(self, conn):
+        """Try to reconnect a pooled connection after an error"""
         try:
             logger.info("Attempting database reconnection")
-            self.disconnect()
             time.sleep(2)  # Brief pause before retry
-            return self.connect()
+            conn.reconnect()
+            return True
         except Exception as e:
-            logger.error(f"Reconnection failed: {e}")
+            logger.error("Reconnection failed: %s", e)
             return False
 
     def disconnect(self):
@@ -179,77 +359,88 @@ class DbConnector:
                 self.logging_thread.join(timeout=5.0)
             self.logging_active = False
 
-        # Close database connection
-        if self.conn:
+        # Close all pooled connections
+        with self._flush_lock:
+            self._release_writer()
+        if self.pool:
             try:
-                self.conn.close()
+                self.pool.close()
                 logger.info("Disconnected from database")
             except mariadb.Error as e:
-                logger.error(f"Error disconnecting from database: {e}")
+                logger.error("Error disconnecting from database: %s", e)
             finally:
-                self.conn = None
-                self.cursor = None
+                self.pool = None
                 self.connected = False
 
     def update_value(self, tag_name, value, unit, timestamp):
         """Update current value for a tag"""
-        self.current_values[tag_name] = {
-            "value": value,
-            "unit": unit,
-            "timestamp": timestamp
-        }
-
-    def log_event(self, event_type, message, severity="info"):
-        """Log an event to the event_log table"""
-        if not self.connected:
-            return False
+        # process_data columns are numeric; raw string values from non-numeric nodes are stored as NULL
+        if not isinstance(value, (int, float)):
+            value = None
 
-        try:
-            query = "INSERT INTO event_log (timestamp, event_type, message, severity) VALUES (NOW(), ?, ?, ?)"
-            self.cursor.execute(query, (event_type, message, severity))
-            self.conn.commit()
-            return True
-        except mariadb.Error as e:
-            logger.error(f"Error logging event: {e}")
-            return False
+        with self._values_lock:
+            index = self._tag_index.get(tag_name)
+            if index is None:  # Tag is not logged to the database
+                return
+            self._values[index] = value
+            self._units[index] = unit
 
-    def get_field_history(self, field_name, hours=24, limit=1000):
-        """Get historical data for a specific database field"""
+    def log_event(self, event_type, message, severity="info", flush=False):
+        """Queue an event for the event_log table, written with the next batch unless flush is set"""
         if not self.connected:
+            return False
+
+        with self._pending_lock:
+            self._pending_events.append((datetime.datetime.now(), event_type, message, severity))
+        if flush:
+            return self.flush()
+        return True
+
+    def _query_history(self, field_name, columns, params):
+        """Run a history query on a mapped process_data field, returns None if the query failed"""
+        # Field names are interpolated into the SQL, so only allow mapped columns
+        if field_name not in self.opc_to_db_mapping.values():
+            logger.warning("Refusing history query for unmapped field: %s", field_name)
             return []
 
         try:
             query = f"""
-                SELECT timestamp, {field_name} 
+                SELECT {columns}
                 FROM process_data 
                 WHERE timestamp > DATE_SUB(NOW(), INTERVAL ? HOUR)
                 AND {field_name} IS NOT NULL
                 ORDER BY timestamp 
                 LIMIT ?
             """
-            self.cursor.execute(query, (hours, limit))
-            return self.cursor.fetchall()
+            with self.pool.get_connection() as conn, conn.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
         except mariadb.Error as e:
-            logger.error(f"Error retrieving field history: {e}")
+            logger.error("Error retrieving field history: %s", e)
+            return None
+
+    def get_field_history(self, field_name, hours=24, limit=1000):
+        """Get historical data for a specific database field, None on database errors"""
+        if not self.connected:
             return []
 
+        return self._query_history(field_name, f"timestamp, {field_name}", (hours, limit))
+
     def get_tag_history(self, tag_name, hours=24, limit=1000):
-        """Get historical data for a specific OPC tag using mapping"""
+        """Get historical data for a specific OPC tag using mapping, None on database errors"""
+        if not self.connected:
+            return []
+
         # Find the database field for this tag
         field_name = self.opc_to_db_mapping.get(tag_name)
         if not field_name:
-            logger.warning(f"No database field mapping found for tag: {tag_name}")
+            logger.warning("No database field mapping found for tag: %s", tag_name)
             return []
 
-        # Get history using the mapped field name
-        history_data = self.get_field_history(field_name, hours, limit)
-
         # Find the unit from current values
-        unit = self.current_values.get(tag_name, {}).get("unit", "")
-
-        # Format results with the unit
-        result = []
-        for timestamp, value in history_data:
-            result.append((value, unit, timestamp))
+        with self._values_lock:
+            index = self._tag_index.get(tag_name)
+            unit = self._units[index] if index is not None else ""
 
-        return result
\ No newline at end of file
+        # Unit is bound as a constant column so rows come back as (value, unit, timestamp)
+        return self._query_history(field_name, f"{field_name}, ?, timestamp", (unit, hours, limit))
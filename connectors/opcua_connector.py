@@ -3,29 +3,125 @@ import logging
 import os
 import time
 import datetime
+import functools
+import threading
+import weakref
 from opcua import Client, ua
-import configparser
 from cryptography import x509
 from cryptography.x509.oid import NameOID
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
+from utils.ring_buffer import RingBuffer
 
 def safe_float(value):
+    """Convert to float rounded to two decimals, or None if the value is not numeric
+
+    Rounds half away from zero on value * 100 for every input type, so a float
+    and its string form give the same result.
+    """
+    value_type = type(value)
+    if value_type is int:
+        return float(value)
+    if value_type is not float:
+        try:
+            value = float(value)
+        except (ValueError, TypeError):
+            return None  # eller return 0.0 hvis foretrukket
+    # Rundt av til to desimaler uten round(); nan/inf returneres uendret
     try:
-        return round(float(value), 2)
-    except (ValueError, TypeError):
-        return None  # eller return 0.0 hvis foretrukket
+        return int(value * 100 + (0.5 if value >= 0 else -0.5)) / 100
+    except (ValueError, OverflowError):
+        return value
+
 
-# Konfigurer logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(levelname)s | %(message)s')
 logger = logging.getLogger(__name__)
 
+# Cached level check for the per-notification log line
+_INFO_ENABLED = logger.isEnabledFor(logging.INFO)
+
+
+def refresh_log_flags():
+    """Re-read cached log levels after logging has been reconfigured"""
+    global _INFO_ENABLED
+    _INFO_ENABLED = logger.isEnabledFor(logging.INFO)
+
+
+# Node types that are passed through as-is instead of converted with safe_float
+RAW_VARIANT_TYPES = (ua.VariantType.Boolean, ua.VariantType.String)
+
+
+def convert_value(node_info, value):
+    """Convert a raw OPC-UA value according to the node's data type"""
+    return value if node_info['raw'] else safe_float(value)
+
+
+def is_unchanged(previous_entry, value, deadband):
+    """True if value equals, or is within deadband of, the last delivered latest_values entry"""
+    if previous_entry is None:
+        return False
+    previous = previous_entry['value']
+    if previous == value:
+        return True
+    return (deadband > 0 and type(previous) is float and type(value) is float
+            and abs(previous - value) < deadband)
+
+
+@functools.lru_cache(maxsize=1)
+def generate_certificates(application_uri, cert_dir):
+    """Return (cert_path, private_key_path), creating them on first use; cached for reconnects"""
+    try:
+        if not os.path.exists(cert_dir):
+            os.makedirs(cert_dir)
+
+        cert_path = os.path.join(cert_dir, "certificate.der")
+        private_key_path = os.path.join(cert_dir, "private_key.pem")
+
+        if os.path.exists(cert_path) and os.path.exists(private_key_path):
+            logger.info("Using existing certificates from %s", cert_dir)
+            return cert_path, private_key_path
+
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        with open(private_key_path, "wb") as f:
+            f.write(private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+
+        subject = issuer = x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, u"OPC UA Client"),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, u"My Organization"),
+            x509.NameAttribute(NameOID.COUNTRY_NAME, u"NO")
+        ])
+
+        try:
+            now = datetime.datetime.now(datetime.UTC)
+        except AttributeError:
+            now = datetime.datetime.utcnow()
+
+        san = x509.SubjectAlternativeName([
+            x509.DNSName(u"localhost"),
+            x509.UniformResourceIdentifier(application_uri)
+        ])
+
+        cert = x509.CertificateBuilder().subject_name(subject).issuer_name(issuer)\
+            .public_key(private_key.public_key()).serial_number(x509.random_serial_number())\
+            .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=365))\
+            .add_extension(san, critical=False).sign(private_key, hashes.SHA256())
+
+        with open(cert_path, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.DER))
+
+        return cert_path, private_key_path
+    except Exception as e:
+        logger.error("Error generating certificates: %s", e)
+        raise
+
 
 class OpcUaConnector:
-    def __init__(self, config_file='config.ini'):
-        self.config = configparser.ConfigParser()
-        self.config.read(config_file)
+    def __init__(self, config):
+        self.config = config
 
         self.endpoint_url = self.config.get('OPCUA', 'server_url')
         self.application_uri = self.config.get('OPCUA', 'application_uri')
@@ -40,9 +136,15 @@ class OpcUaConnector:
             node_id = monitoring_section[f'node{i}_id']
             node_name = monitoring_section[f'node{i}_name']
             node_unit = monitoring_section.get(f'node{i}_unit', '')
-            self.nodes_to_monitor.append({'id': node_id, 'name': node_name, 'unit': node_unit})
+            node_deadband = self._parse_deadband(f'node{i}_deadband', monitoring_section.get(f'node{i}_deadband', '0'))
+            self.nodes_to_monitor.append({'id': node_id, 'name': node_name, 'unit': node_unit,
+                                          'deadband': node_deadband, 'raw': False})
             i += 1
 
+        # Lookup tables for the notification path
+        self.nodes_by_id = {n['id']: n for n in self.nodes_to_monitor}
+        self.node_ids = weakref.WeakKeyDictionary()
+
         self.client = None
         self.subscription = None
         self.handles = []
@@ -50,58 +152,36 @@ class OpcUaConnector:
         self.latest_values = {}
         self.value_callbacks = []
 
-    def add_value_callback(self, callback):
-        self.value_callbacks.append(callback)
+        # Value updates are queued by the subscription thread and dispatched separately
+        self.updates = RingBuffer(self.config.getint('OPCUA', 'update_buffer_size', fallback=1024))
+        self.dispatch_thread = None
+        self.dispatch_stop = threading.Event()
+        self.dispatch_lock = threading.Lock()
 
-    def generate_certificates(self):
+    def _parse_deadband(self, key, raw):
         try:
-            cert_dir = os.path.join(os.getcwd(), "certificates")
-            if not os.path.exists(cert_dir):
-                os.makedirs(cert_dir)
-
-            cert_path = os.path.join(cert_dir, "certificate.der")
-            private_key_path = os.path.join(cert_dir, "private_key.pem")
-
-            if os.path.exists(cert_path) and os.path.exists(private_key_path):
-                logger.info(f"Using existing certificates from {cert_dir}")
-                return cert_path, private_key_path
-
-            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
-            with open(private_key_path, "wb") as f:
-                f.write(private_key.private_bytes(
-                    encoding=serialization.Encoding.PEM,
-                    format=serialization.PrivateFormat.PKCS8,
-                    encryption_algorithm=serialization.NoEncryption()
-                ))
-
-            subject = issuer = x509.Name([
-                x509.NameAttribute(NameOID.COMMON_NAME, u"OPC UA Client"),
-                x509.NameAttribute(NameOID.ORGANIZATION_NAME, u"My Organization"),
-                x509.NameAttribute(NameOID.COUNTRY_NAME, u"NO")
-            ])
+            deadband = float(raw)
+        except ValueError:
+            logger.warning("Invalid %s value %r, using 0", key, raw)
+            return 0.0
+        if deadband < 0:
+            logger.warning("Negative %s value %r, using 0", key, raw)
+            return 0.0
+        return deadband
 
-            try:
-                now = datetime.datetime.now(datetime.UTC)
-            except AttributeError:
-                now = datetime.datetime.utcnow()
-
-            san = x509.SubjectAlternativeName([
-                x509.DNSName(u"localhost"),
-                x509.UniformResourceIdentifier(self.application_uri)
-            ])
-
-            cert = x509.CertificateBuilder().subject_name(subject).issuer_name(issuer)\
-                .public_key(private_key.public_key()).serial_number(x509.random_serial_number())\
-                .not_valid_before(now).not_valid_after(now + datetime.timedelta(days=365))\
-                .add_extension(san, critical=False).sign(private_key, hashes.SHA256())
-
-            with open(cert_path, "wb") as f:
-                f.write(cert.public_bytes(serialization.Encoding.DER))
+    def add_value_callback(self, callback):
+        # Replay values delivered so far, since repeats of them are coalesced away
+        with self.dispatch_lock:
+            self.value_callbacks.append(callback)
+            for name, entry in list(self.latest_values.items()):
+                try:
+                    callback(name, entry["value"], entry["unit"], entry["timestamp"])
+                except Exception as e:
+                    logger.error("Error in callback: %s", e)
 
-            return cert_path, private_key_path
-        except Exception as e:
-            logger.error(f"Error generating certificates: {e}")
-            raise
+    def generate_certificates(self):
+        cert_dir = os.path.join(os.getcwd(), "certificates")
+        return generate_certificates(self.application_uri, cert_dir)
 
     def connect(self):
         try:
@@ -109,21 +189,23 @@ class OpcUaConnector:
 
             self.client = Client(self.endpoint_url)
             security_string = f"{self.security_policy},{self.security_mode},{cert_path},{private_key_path}"
-            logger.info(f"Setting security with string: {security_string}")
+            logger.info("Setting security with string: %s", security_string)
             self.client.set_security_string(security_string)
 
             self.client.application_uri = self.application_uri
             self.client.security_checks = False
-            logger.info(f"Connecting to {self.endpoint_url}...")
+            logger.info("Connecting to %s...", self.endpoint_url)
             self.client.connect()
             self.connected = True
             return True
         except Exception as e:
-            logger.error(f"Error connecting to server: {e}")
+            logger.error("Error connecting to server: %s", e)
             self.disconnect()
             return False
 
     def disconnect(self):
+        self._stop_dispatcher()
+
         if self.subscription:
             try:
                 for handle in self.handles:
@@ -131,7 +213,7 @@ class OpcUaConnector:
                 self.subscription.delete()
                 self.subscription = None
             except Exception as e:
-                logger.warning(f"Error cleaning up subscription: {e}")
+                logger.warning("Error cleaning up subscription: %s", e)
 
         if self.client:
             try:
@@ -139,7 +221,7 @@ class OpcUaConnector:
                 self.client.disconnect()
                 logger.info("Disconnected successfully")
             except Exception as e:
-                logger.error(f"Error disconnecting: {e}")
+                logger.error("Error disconnecting: %s", e)
             finally:
                 self.client = None
                 self.connected = False
@@ -150,6 +232,8 @@ class OpcUaConnector:
             return False
 
         try:
+            self._start_dispatcher()
+
             handler = SubHandler(self)
             self.subscription = self.client.create_subscription(500, handler)
             logger.info("Created subscription with publishing interval of 500ms")
@@ -159,37 +243,77 @@ class OpcUaConnector:
                 try:
                     node_id = node_info["id"]
                     node = self.client.get_node(node_id)
+                    self.node_ids[node] = node_id
+                    node_info["raw"] = self._is_raw_node(node)
                     handle = self.subscription.subscribe_data_change(node)
                     self.handles.append(handle)
-                    logger.info(f"Subscribed to: {node_info['name']} ({node_id})")
+                    logger.info("Subscribed to: %s (%s)", node_info['name'], node_id)
 
                     try:
-                        value = safe_float(node.get_value())
+                        value = convert_value(node_info, node.get_value())
                         unit = node_info.get("unit", "")
-                        logger.info(f"Initial value of {node_info['name']}: {value} {unit}")
-                        self.latest_values[node_info["name"]] = {
-                            "value": value,
-                            "unit": unit,
-                            "timestamp": datetime.datetime.now().isoformat()
-                        }
-                        self._notify_callbacks(node_info["name"], value, unit)
+                        logger.info("Initial value of %s: %s %s", node_info['name'], value, unit)
+                        self.publish_value(node_info["name"], value, unit)
                     except Exception as e:
-                        logger.warning(f"Could not read initial value for {node_id}: {e}")
+                        logger.warning("Could not read initial value for %s: %s", node_id, e)
                 except Exception as e:
-                    logger.error(f"Failed to subscribe to {node_id}: {e}")
+                    logger.error("Failed to subscribe to %s: %s", node_id, e)
 
             return True
         except Exception as e:
-            logger.error(f"Error subscribing to nodes: {e}")
+            logger.error("Error subscribing to nodes: %s", e)
+            return False
+
+    def _is_raw_node(self, node):
+        try:
+            return node.get_data_type_as_variant_type() in RAW_VARIANT_TYPES
+        except Exception as e:
+            logger.warning("Could not read data type for %s: %s", node, e)
             return False
 
-    def _notify_callbacks(self, name, value, unit):
-        timestamp = datetime.datetime.now()
+    def publish_value(self, name, value, unit):
+        # Keyed by name: a tag's unread update is replaced rather than queued twice
+        self.updates.put((name, value, unit, time.time()), key=name)
+
+    def _start_dispatcher(self):
+        if self.dispatch_thread and self.dispatch_thread.is_alive():
+            return
+
+        self.dispatch_stop.clear()
+        self.dispatch_thread = threading.Thread(target=self._dispatch_worker)
+        self.dispatch_thread.daemon = True
+        self.dispatch_thread.start()
+
+    def _stop_dispatcher(self):
+        self.dispatch_stop.set()
+        if self.dispatch_thread and self.dispatch_thread.is_alive():
+            self.dispatch_thread.join(timeout=2.0)
+        self.dispatch_thread = None
+
+    def _dispatch_worker(self):
+        reported_drops = 0
+        while not self.dispatch_stop.is_set():
+            batch = self.updates.get_batch(timeout=0.5)
+            if self.updates.dropped > reported_drops:
+                logger.warning("Update buffer full, %s value updates dropped so far; "
+                               "consider raising OPCUA.update_buffer_size", self.updates.dropped)
+                reported_drops = self.updates.dropped
+
+            for name, value, unit, timestamp in batch:
+                with self.dispatch_lock:
+                    self.latest_values[name] = {
+                        "value": value,
+                        "unit": unit,
+                        "timestamp": timestamp
+                    }
+                    self._notify_callbacks(name, value, unit, timestamp)
+
+    def _notify_callbacks(self, name, value, unit, timestamp):
         for callback in self.value_callbacks:
             try:
                 callback(name, value, unit, timestamp)
             except Exception as e:
-                logger.error(f"Error in callback: {e}")
+                logger.error("Error in callback: %s", e)
 
 
 class SubHandler:
@@ -198,24 +322,25 @@ class SubHandler:
 
     def datachange_notification(self, node, val, data):
         try:
-            node_id = node.nodeid.to_string()
-            node_info = next((n for n in self.connector.nodes_to_monitor if n["id"] == node_id), None)
+            node_id = self.connector.node_ids.get(node)
+            if node_id is None:
+                node_id = node.nodeid.to_string()
+            node_info = self.connector.nodes_by_id.get(node_id)
 
             if node_info:
                 name = node_info["name"]
                 unit = node_info.get("unit", "")
-                value = safe_float(val)
+                value = convert_value(node_info, val)
 
-                self.connector.latest_values[name] = {
-                    "value": value,
-                    "unit": unit,
-                    "timestamp": datetime.datetime.now().isoformat()
-                }
+                # Skip repeated samples so callbacks only see real changes. Compared against
+                # what was delivered, so an update still in the buffer is never assumed sent
+                if is_unchanged(self.connector.latest_values.get(name), value, node_info["deadband"]):
+                    return
 
-                unit_str = f" {unit}" if unit else ""
-                logger.info(f"{name}: {value}{unit_str}")
-                self.connector._notify_callbacks(name, value, unit)
+                if _INFO_ENABLED:
+                    logger.info("%s: %s%s", name, value, f" {unit}" if unit else "")
+                self.connector.publish_value(name, value, unit)
             else:
-                logger.info(f"Data change for unknown node {node_id}: {val}")
+                logger.info("Data change for unknown node %s: %s", node_id, val)
         except Exception as e:
-            logger.error(f"Error in datachange_notification: {e}")
\ No newline at end of file
+            logger.error("Error in datachange_notification: %s", e)
\ No newline at end of file
@@ -4,12 +4,29 @@ Unity Connector Module - HTTP API Server for OPC-UA data
 import logging
 import datetime
 import threading
-from flask import Flask, jsonify, request
+import time
+from collections import OrderedDict
+import orjson
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
-from werkzeug.serving import make_server
+from waitress import create_server
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of (tag, hours) history responses kept in memory
+HISTORY_CACHE_SIZE = 128
+
+EMPTY_HISTORY_JSON = b"[]"
+
+
+def format_value(entry):
+    """Return a value entry with its epoch timestamp formatted as ISO 8601"""
+    return {
+        "value": entry["value"],
+        "unit": entry["unit"],
+        "timestamp": datetime.datetime.fromtimestamp(entry["timestamp"]).isoformat()
+    }
+
 
 class UnityConnector:
     """HTTP API Gateway for OPC UA values - connects to Unity"""
@@ -22,11 +39,15 @@ class UnityConnector:
             self.host = '0.0.0.0'
             self.port = 5000
             self.cors_enabled = True
+            self.threads = 8
+            self.history_cache_ttl = 5.0
         else:
             # Hent fra config
             self.host = config.get('HTTP', 'host', fallback='0.0.0.0')
             self.port = config.getint('HTTP', 'port', fallback=5000)
             self.cors_enabled = config.getboolean('HTTP', 'cors_enabled', fallback=True)
+            self.threads = config.getint('HTTP', 'threads', fallback=8)
+            self.history_cache_ttl = config.getfloat('HTTP', 'history_cache_ttl', fallback=5.0)
 
         # Store reference to OPC-UA connector
         self.opcua = opcua_connector
@@ -36,6 +57,16 @@ class UnityConnector:
 
         # Global data store
         self.latest_values = {}
+        self._values_lock = threading.Lock()
+
+        # Serialized /api/values response, rebuilt only after a value changes
+        self._values_json_cache = None
+        self._values_json_dirty = True
+        self._value_json_cache = {}
+
+        # Recent history responses keyed by (name, hours) with their expiry time
+        self._history_cache = OrderedDict()
+        self._history_lock = threading.Lock()
 
         # Server objects
         self.app = Flask(__name__)
@@ -52,12 +83,91 @@ class UnityConnector:
 
     def on_value_update(self, name, value, unit, timestamp):
         """Callback for OPC UA value updates"""
-        self.latest_values[name] = {
-            "value": value,
-            "unit": unit,
-            "timestamp": timestamp.isoformat() if hasattr(timestamp, 'isoformat') else str(timestamp)
-        }
-        logger.debug(f"Updated value: {name} = {value} {unit}")
+        # Timestamp is kept as epoch seconds and only formatted when served
+        with self._values_lock:
+            self.latest_values[name] = {
+                "value": value,
+                "unit": unit,
+                "timestamp": timestamp
+            }
+            self._values_json_dirty = True
+            self._value_json_cache.pop(name, None)
+        logger.debug("Updated value: %s = %s %s", name, value, unit)
+
+    def _values_json(self):
+        """Return all current values as JSON bytes, serializing only when changed"""
+        with self._values_lock:
+            if self._values_json_dirty:
+                self._values_json_cache = orjson.dumps(
+                    {name: format_value(entry) for name, entry in self.latest_values.items()})
+                self._values_json_dirty = False
+            return self._values_json_cache
+
+    def _value_json(self, name):
+        """Return a single value as JSON bytes, or None if the name is unknown"""
+        with self._values_lock:
+            payload = self._value_json_cache.get(name)
+            if payload is None:
+                entry = self.latest_values.get(name)
+                if entry is None:
+                    return None
+                payload = orjson.dumps(format_value(entry))
+                self._value_json_cache[name] = payload
+            return payload
+
+    def _history_json(self, name, hours):
+        """Return tag history as JSON bytes, reusing results for repeated polls within the TTL
+
+        Returns None if the database query failed; such results are not cached.
+        """
+        key = (name, hours)
+        now = time.monotonic()
+        with self._history_lock:
+            cached = self._history_cache.get(key)
+            if cached is not None and cached[0] > now:
+                self._history_cache.move_to_end(key)
+                return cached[1]
+
+        history = self.db.get_tag_history(name, hours)
+        if history is None:
+            return None
+
+        # DECIMAL columns come back as decimal.Decimal; sent as strings, as jsonify did
+        payload = orjson.dumps(
+            [{"value": value, "unit": unit, "timestamp": timestamp} for value, unit, timestamp in history],
+            default=str)
+
+        with self._history_lock:
+            self._history_cache[key] = (now + self.history_cache_ttl, payload)
+            self._history_cache.move_to_end(key)
+            while len(self._history_cache) > HISTORY_CACHE_SIZE:
+                self._history_cache.popitem(last=False)
+        return payload
+
+    def _json_response(self, start_response, payload):
+        """Send a 200 JSON payload directly through WSGI"""
+        headers = [('Content-Type', 'application/json'), ('Content-Length', str(len(payload)))]
+        if self.cors_enabled:
+            headers.append(('Access-Control-Allow-Origin', '*'))
+        start_response('200 OK', headers)
+        return [payload]
+
+    def _wsgi_app(self, environ, start_response):
+        """WSGI entry point that answers the polled value endpoints without Flask"""
+        if environ.get('REQUEST_METHOD') == 'GET':
+            path = environ.get('PATH_INFO', '')
+            if path == '/api/values':
+                return self._json_response(start_response, self._values_json())
+
+            if path.startswith('/api/value/'):
+                # WSGI passes the path as latin-1 decoded bytes
+                name = path[len('/api/value/'):].encode('latin-1').decode('utf-8', 'replace')
+                payload = self._value_json(name) if '/' not in name else None
+                if payload is not None:
+                    return self._json_response(start_response, payload)
+
+        # Everything else, including unknown names, is handled by Flask
+        return self.app(environ, start_response)
 
     def _setup_routes(self):
         """Set up Flask API routes"""
@@ -66,13 +176,14 @@ class UnityConnector:
         @self.app.route('/api/values', methods=['GET'])
         def get_all_values():
             """Return all current values"""
-            return jsonify(self.latest_values)
+            return Response(self._values_json(), mimetype='application/json')
 
         @self.app.route('/api/value/<name>', methods=['GET'])
         def get_value(name):
             """Return a specific value by name"""
-            if name in self.latest_values:
-                return jsonify(self.latest_values[name])
+            payload = self._value_json(name)
+            if payload is not None:
+                return Response(payload, mimetype='application/json')
             return jsonify({"error": "Value not found"}), 404
 
         @self.app.route('/api/status', methods=['GET'])
@@ -94,20 +205,13 @@ class UnityConnector:
             # Get hours parameter from query string, default to 24
             hours = request.args.get('hours', default=24, type=int)
 
-            history = self.db.get_tag_history(name, hours)
-            if not history:
+            payload = self._history_json(name, hours)
+            if payload is None:
+                return jsonify({"error": "Database query failed"}), 503
+            if payload == EMPTY_HISTORY_JSON:
                 return jsonify({"error": "No history found or tag does not exist"}), 404
 
-            # Format the data for the response
-            result = []
-            for value, unit, timestamp in history:
-                result.append({
-                    "value": value,
-                    "unit": unit,
-                    "timestamp": timestamp.isoformat() if hasattr(timestamp, 'isoformat') else str(timestamp)
-                })
-
-            return jsonify(result)
+            return Response(payload, mimetype='application/json')
 
     def start(self):
         """Start the HTTP server"""
@@ -121,18 +225,18 @@ class UnityConnector:
             self.opcua.add_value_callback(self.on_value_update)
 
             # Start Flask server in a separate thread
-            self.server = make_server(self.host, self.port, self.app)
-            self.server_thread = threading.Thread(target=self.server.serve_forever)
+            self.server = create_server(self._wsgi_app, host=self.host, port=self.port, threads=self.threads)
+            self.server_thread = threading.Thread(target=self.server.run)
             self.server_thread.daemon = True
             self.server_thread.start()
 
             self.running = True
-            logger.info(f"HTTP API server started at http://{self.host}:{self.port}")
+            logger.info("HTTP API server started at http://%s:%s", self.host, self.port)
             logger.info("Unity can now connect to this endpoint")
             return True
 
         except Exception as e:
-            logger.error(f"Error starting HTTP server: {e}")
+            logger.error("Error starting HTTP server: %s", e)
             self.stop()
             return False
 
@@ -142,7 +246,7 @@ class UnityConnector:
 
         # Stop HTTP server
         if self.server:
-            self.server.shutdown()
+            self.server.close()
             if self.server_thread and self.server_thread.is_alive():
                 self.server_thread.join(timeout=1.0)
 
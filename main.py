@@ -11,10 +11,10 @@ import sys
 import configparser
 import logging
 import argparse
-from connectors.opcua_connector import OpcUaConnector
+from connectors.opcua_connector import OpcUaConnector, refresh_log_flags
 from connectors.unity_connector import UnityConnector
 from connectors.db_connector import DbConnector
-from utils.logging_utils import setup_logger, get_log_level
+from utils.logging_utils import setup_logger, stop_logger, get_log_level
 
 # Global objects for signal handlers
 opcua_connector = None
@@ -38,6 +38,7 @@ def signal_handler(sig, frame):
     if db_connector and db_connector.connected:
         db_connector.disconnect()
 
+    # SystemExit unwinds through main(), whose finally block stops the logger
     sys.exit(0)
 
 
@@ -79,13 +80,17 @@ def main():
                           log_to_file=config.getboolean('LOGGING', 'log_to_file', fallback=False),
                           log_dir=config.get('LOGGING', 'log_dir', fallback='logs'))
 
+    # Connector modules log under 'connectors.*', apply the same level there
+    logging.getLogger('connectors').setLevel(log_level)
+    refresh_log_flags()
+
     # Register signal handlers
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     # Initialize OPC-UA connector
     logger.info("Initializing OPC-UA connector...")
-    opcua_connector = OpcUaConnector(config_file)
+    opcua_connector = OpcUaConnector(config)
 
     # Connect to OPC-UA server
     if not opcua_connector.connect():
@@ -101,14 +106,14 @@ def main():
     # Initialize database connector if enabled
     if config.getboolean('DATABASE', 'enabled', fallback=False):
         logger.info("Initializing database connector...")
-        db_connector = DbConnector(config_file)
+        db_connector = DbConnector(config)
         if db_connector.connect():
             # Register database callback with OPC-UA connector
             opcua_connector.add_value_callback(db_update_callback)
             logger.info("Database logging enabled")
 
             # Log startup event
-            db_connector.log_event("system", "OPC-UA Gateway service started", "info")
+            db_connector.log_event("system", "OPC-UA Gateway service started", "info", flush=True)
         else:
             logger.warning("Database connection failed, continuing without database logging")
 
@@ -144,8 +149,9 @@ def main():
             opcua_connector.disconnect()
         if db_connector and db_connector.connected:
             # Log shutdown event
-            db_connector.log_event("system", "OPC-UA Gateway service stopped", "info")
+            db_connector.log_event("system", "OPC-UA Gateway service stopped", "info", flush=True)
             db_connector.disconnect()
+        stop_logger()
 
     return 0
 
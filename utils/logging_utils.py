@@ -2,16 +2,28 @@
 Logging utilities for OPC-UA Gateway
 """
 import logging
+import logging.handlers
 import os
+import queue
 import sys
 from datetime import datetime
 
 
 def setup_logger(name, log_level=logging.INFO, log_to_file=False, log_dir='logs'):
-    """Set up a logger with console and optional file output"""
+    """Set up console and optional file output on the root logger and return the named logger
+
+    Handlers sit behind a QueueListener on the root logger, so records from every
+    module (including the connectors' callback threads) are written on the listener
+    thread instead of in the caller.
+    """
+    root = logging.getLogger()
+    root.setLevel(log_level)
+    stop_logger()
+    root.handlers = []  # Clear any existing handlers
+
     logger = logging.getLogger(name)
     logger.setLevel(log_level)
-    logger.handlers = []  # Clear any existing handlers
+    logger.handlers = []
 
     # Create formatter
     formatter = logging.Formatter('%(asctime)s | %(levelname)s | %(name)s | %(message)s')
@@ -19,7 +31,7 @@ def setup_logger(name, log_level=logging.INFO, log_to_file=False, log_dir='logs'
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
 
     # File handler (optional)
     if log_to_file:
@@ -33,11 +45,28 @@ def setup_logger(name, log_level=logging.INFO, log_to_file=False, log_dir='logs'
 
         file_handler = logging.FileHandler(log_file)
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(-1)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    root.queue_listener = listener
 
     return logger
 
 
+def stop_logger():
+    """Flush queued records and stop the root logger's listener thread, if any"""
+    root = logging.getLogger()
+    listener = getattr(root, 'queue_listener', None)
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        root.queue_listener = None
+
+
 def get_log_level(level_str):
     """Convert string log level to logging constant"""
     levels = {
@@ -0,0 +1,75 @@
+"""
+Bounded ring buffer for handing value updates between threads
+"""
+import threading
+
+
+class RingBuffer:
+    """Fixed-size FIFO buffer between producer threads and a single consumer
+
+    Items put with a key replace the unread item with the same key in place, so
+    the buffer holds at most one pending entry per key and a key's newest item
+    is only lost if there are more distinct keys than slots.
+    """
+
+    def __init__(self, capacity=1024):
+        """Initialize the buffer with a fixed number of slots"""
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+
+        self._slots = [None] * capacity
+        self._capacity = capacity
+        self._head = 0  # Next slot to read
+        self._tail = 0  # Next slot to write
+        self._key_positions = {}  # Key -> position of its unread item
+        self._not_empty = threading.Condition(threading.Lock())
+
+        # Number of items overwritten because the consumer fell behind
+        self.dropped = 0
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def put(self, item, key=None):
+        """Append an item, or replace the unread item with the same key
+
+        If the buffer is full the oldest item is overwritten and counted in dropped.
+        """
+        with self._not_empty:
+            if key is not None:
+                position = self._key_positions.get(key)
+                if position is not None:
+                    self._slots[position % self._capacity] = (key, item)
+                    return
+
+            was_empty = self._tail == self._head
+            if self._tail - self._head == self._capacity:
+                oldest_key = self._slots[self._head % self._capacity][0]
+                if oldest_key is not None:
+                    del self._key_positions[oldest_key]
+                self._head += 1
+                self.dropped += 1
+
+            self._slots[self._tail % self._capacity] = (key, item)
+            if key is not None:
+                self._key_positions[key] = self._tail
+            self._tail += 1
+
+            # The consumer only sleeps on an empty buffer, so only wake it then
+            if was_empty:
+                self._not_empty.notify()
+
+    def get_batch(self, timeout=None):
+        """Wait for items and return everything currently buffered, oldest first"""
+        with self._not_empty:
+            if self._tail == self._head:
+                self._not_empty.wait(timeout)
+
+            batch = []
+            while self._head < self._tail:
+                index = self._head % self._capacity
+                batch.append(self._slots[index][1])
+                self._slots[index] = None
+                self._head += 1
+            self._key_positions.clear()
+            return batch